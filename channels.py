@@ -0,0 +1,31 @@
+import numpy as np
+
+ADC_FULL_SCALE = 5.0  # ADC满量程 ±5V
+ADC_COUNTS = 2048  # 12位带符号ADC的半量程码值
+ADC_SCALE = np.float32(ADC_FULL_SCALE / ADC_COUNTS)
+
+
+def parse_frame(raw_waveform, n_channels=1):
+    """
+    解析交织的多通道ADC数据
+    返回形状为 (采样点数, 通道数) 的电压数组，每一列都是共享同一块内存的跨步视图，
+    不为各通道单独复制数据；通道数不是正整数时抛出 ValueError
+    """
+    if isinstance(n_channels, bool) or not isinstance(n_channels, int) or n_channels < 1:
+        raise ValueError(f"无效的通道数: {n_channels!r}")
+    samples = np.asarray(raw_waveform, dtype=np.float32)
+    samples *= ADC_SCALE
+    usable = len(samples) - len(samples) % n_channels  # 丢弃末尾不完整的一组采样
+    return samples[:usable].reshape(-1, n_channels)
+
+
+def find_trigger(signal, level):
+    """查找第一个上升沿过触发电平的位置，未触发时返回0"""
+    above = signal >= level
+    crossings = np.flatnonzero(~above[:-1] & above[1:])
+    return int(crossings[0]) + 1 if len(crossings) else 0
+
+
+def decimation_step(n_samples, max_points):
+    """所有通道共用的抽取步长，使每条曲线最多绘制 max_points 个点"""
+    return max(1, -(-n_samples // max_points))
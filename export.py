@@ -0,0 +1,286 @@
+import os
+import queue
+import tempfile
+import threading
+import wave
+import zipfile
+import logging
+import numpy as np
+from PyQt5.QtCore import pyqtSignal, QObject
+from channels import ADC_FULL_SCALE
+
+log = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "wav", "npz")
+CHUNK_SAMPLES = 1 << 16  # 每次写入的采样点数，导出时内存占用与采集长度无关
+WAV_MAX_DATA_BYTES = 0xFFFFFFFF - 36  # RIFF 文件头中32位长度字段可表示的最大数据量
+
+
+class FrameSource:
+    '''
+    内存中的若干帧（当前帧或最近N帧），按块逐帧切片输出，不拼接成一个大数组
+    各帧之间的采集并不连续，iter_chunks 输出的块不会跨越帧边界
+    '''
+    def __init__(self, frames, sample_rate):
+        self.frames = [frame for frame in frames if len(frame)]
+        self.sample_rate = sample_rate
+        self.n_channels = self.frames[0].shape[1] if self.frames else 0
+        self.frame_lengths = [len(frame) for frame in self.frames]
+        self.n_samples = sum(self.frame_lengths)
+
+    def iter_chunks(self, chunk_samples=CHUNK_SAMPLES):
+        """逐块输出 (帧序号, 块在帧内的起始位置, 数据块)"""
+        for index, frame in enumerate(self.frames):
+            for start in range(0, len(frame), chunk_samples):
+                yield index, start, frame[start:start + chunk_samples]
+
+
+class CaptureFile:
+    '''
+    录制在磁盘上的采集数据：float32，按 (采样点数, 通道数) 行优先排列，frame_lengths 记录各帧长度
+    导出时通过 memmap 分块读取
+    '''
+    def __init__(self, path, n_channels, sample_rate, frame_lengths):
+        self.path = path
+        self.n_channels = n_channels
+        self.sample_rate = sample_rate
+        self.frame_lengths = frame_lengths
+        self.n_samples = sum(frame_lengths)
+
+    def iter_chunks(self, chunk_samples=CHUNK_SAMPLES):
+        """逐块输出 (帧序号, 块在帧内的起始位置, 数据块)"""
+        if not self.n_samples:
+            return
+        data = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.n_samples, self.n_channels))
+        offset = 0
+        for index, length in enumerate(self.frame_lengths):
+            for start in range(0, length, chunk_samples):
+                stop = min(start + chunk_samples, length)
+                yield index, start, np.array(data[offset + start:offset + stop])  # 复制出当前块，及时释放映射页
+            offset += length
+        del data
+
+    def remove(self):
+        """删除录制文件，失败时返回False"""
+        try:
+            os.remove(self.path)
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            log.warning(f"删除录制文件失败: {self.path}: {e}")
+            return False
+
+
+class RecordingError(Exception):
+    pass
+
+
+class CaptureRecorder:
+    '''
+    采集录制器
+    append 只把帧放入有界队列，由后台线程写入临时文件，不阻塞界面刷新
+    写入失败（如磁盘已满）后不再接收新帧，stop 时抛出 RecordingError
+    '''
+    def __init__(self, max_queued_frames=64):
+        fd, self.path = tempfile.mkstemp(prefix="scope_capture_", suffix=".f32")
+        self.file = os.fdopen(fd, "wb")
+        self.queue = queue.Queue(maxsize=max_queued_frames)
+        self.n_channels = None
+        self.sample_rate = None
+        self.frame_lengths = []  # 已成功写入文件的各帧长度，由写线程维护
+        self.dropped_frames = 0
+        self.error = None  # 写线程遇到的异常
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, frame, sample_rate):
+        if self.error is not None:
+            return
+        if self.n_channels is None:
+            self.n_channels = frame.shape[1]
+            self.sample_rate = sample_rate
+        elif frame.shape[1] != self.n_channels or sample_rate != self.sample_rate:
+            log.warning("通道数或采样率发生变化，该帧不录制")
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def write_loop(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # 写入已失败，继续取出并丢弃队列中的帧，直到收到结束标记
+            try:
+                self.file.write(np.ascontiguousarray(frame, dtype=np.float32).tobytes())
+                self.frame_lengths.append(len(frame))
+            except Exception as e:
+                log.error(f"录制写入失败: {e}")
+                self.error = e
+
+    def stop(self):
+        """停止录制，返回录制结果；写入失败时删除录制文件并抛出 RecordingError"""
+        # 写线程存活时会持续取队列，put 只会短暂等待；写线程意外退出时不再放结束标记，避免界面线程阻塞
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        try:
+            self.file.close()
+        except OSError as e:
+            self.error = self.error or e
+        if self.error is not None:
+            CaptureFile(self.path, 0, self.sample_rate, []).remove()
+            raise RecordingError(f"录制写入失败: {self.error}")
+        if self.dropped_frames:
+            log.warning(f"录制期间因磁盘写入跟不上丢弃了 {self.dropped_frames} 帧")
+        return CaptureFile(self.path, self.n_channels or 0, self.sample_rate, self.frame_lengths)
+
+
+def write_csv(path, source, progress):
+    """
+    CSV：frame 为帧序号，time 为由采样率计算的帧内时间（秒），其后每列一个通道
+    帧与帧之间的采集不连续，time 在每帧开头从0重新计
+    """
+    dt = 1.0 / source.sample_rate if source.sample_rate else 1.0
+    header = ",".join(["frame", "time"] + [f"CH{ch + 1}" for ch in range(source.n_channels)])
+    fmt = ["%d", "%.9g"] + ["%.9g"] * source.n_channels
+    offset = 0
+    with open(path, "w", newline="") as f:
+        f.write(header + "\n")
+        for index, start, chunk in source.iter_chunks():
+            rows = np.empty((len(chunk), source.n_channels + 2), dtype=np.float64)
+            rows[:, 0] = index
+            rows[:, 1] = np.arange(start, start + len(chunk)) * dt
+            rows[:, 2:] = chunk
+            np.savetxt(f, rows, delimiter=",", fmt=fmt)
+            offset += len(chunk)
+            progress(offset)
+
+
+def write_wav(path, source, progress):
+    """WAV：16位PCM，采样率保持原始采样率，ADC满量程映射为PCM满量程；各帧首尾相接"""
+    data_bytes = source.n_samples * source.n_channels * 2
+    if data_bytes > WAV_MAX_DATA_BYTES:
+        # wave 模块的文件头长度字段为32位，超过上限会在写入数GB后才失败，因此提前检查
+        raise ValueError(f"WAV 数据量 {data_bytes / 2**30:.2f} GiB 超过 4 GiB 上限，请改用 NPZ 或 CSV 导出")
+    scale = 32767 / ADC_FULL_SCALE
+    offset = 0
+    with wave.open(path, "wb") as f:
+        f.setnchannels(source.n_channels)
+        f.setsampwidth(2)
+        f.setframerate(int(source.sample_rate or 1))
+        for _, _, chunk in source.iter_chunks():
+            pcm = np.clip(chunk * scale, -32768, 32767).astype("<i2")
+            f.writeframes(pcm.tobytes())
+            offset += len(chunk)
+            progress(offset)
+
+
+def write_npz(path, source, progress):
+    """
+    NPZ：data 为 (采样点数, 通道数) 的 float32 数组，sample_rate 为采样率，
+    frame_lengths 为各帧长度（帧间不连续）；data 分块流式写入压缩包
+    """
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+              "fortran_order": False,
+              "shape": (source.n_samples, source.n_channels)}
+    offset = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+        with zf.open("data.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f, header)
+            for _, _, chunk in source.iter_chunks():
+                f.write(np.ascontiguousarray(chunk, dtype=np.float32).tobytes())
+                offset += len(chunk)
+                progress(offset)
+        with zf.open("sample_rate.npy", "w") as f:
+            np.lib.format.write_array(f, np.asarray(source.sample_rate or 0))
+        with zf.open("frame_lengths.npy", "w") as f:
+            np.lib.format.write_array(f, np.asarray(source.frame_lengths, dtype=np.int64))
+
+
+WRITERS = {"csv": write_csv, "wav": write_wav, "npz": write_npz}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportWorker(QObject):
+    '''
+    后台导出
+    在独立线程中分块写文件，通过信号报告进度，界面线程不参与写入
+    dispatch 用于把信号发射转交到界面主线程执行，如 lambda fn: root.after(0, fn)
+    '''
+    progress_signal = pyqtSignal(int)  # 进度百分比
+    finished_signal = pyqtSignal(str)  # 导出完成，文件路径
+    error_signal = pyqtSignal(str)  # 导出失败，错误信息
+
+    def __init__(self, source, path, fmt, dispatch=None):
+        super().__init__()
+        if fmt not in WRITERS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        self.source = source
+        self.path = path
+        self.fmt = fmt
+        self.dispatch = dispatch or (lambda fn: fn())
+        self.cancelled = threading.Event()
+        self.on_cancelled = None  # 取消后、写线程释放数据源后调用，用于删除录制文件
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def cancel(self, timeout=2.0):
+        """取消导出并等待写线程在当前块结束后退出，已写出的部分文件会被删除"""
+        self.cancelled.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def remove_partial_output(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"删除未完成的导出文件失败: {self.path}: {e}")
+
+    def run(self):
+        total = max(self.source.n_samples, 1)
+        last_percent = -1
+
+        def progress(written):
+            nonlocal last_percent
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+            percent = written * 100 // total
+            if percent != last_percent:  # 只在百分比变化时发信号，避免刷屏界面事件队列
+                last_percent = percent
+                self.dispatch(lambda: self.progress_signal.emit(percent))
+
+        try:
+            if not self.source.n_samples:
+                raise ValueError("没有可导出的数据")
+            WRITERS[self.fmt](self.path, self.source, progress)
+            log.info(f"已导出 {self.source.n_samples} 个采样点到 {self.path}")
+            self.dispatch(lambda: self.finished_signal.emit(self.path))
+        except ExportCancelled:
+            # 取消通常发生在程序退出时，此时不再向界面发信号
+            log.info(f"导出已取消: {self.path}")
+            self.remove_partial_output()
+        except Exception as e:
+            log.error(f"导出失败: {e}")
+            self.remove_partial_output()  # 写到一半的文件不完整（NPZ 文件头中的形状也不再正确）
+            message = str(e)
+            self.dispatch(lambda: self.error_signal.emit(message))
+        # 放在 except 之外：此时异常回溯已释放，数据源的 memmap 不再被引用
+        if self.cancelled.is_set() and self.on_cancelled is not None:
+            self.on_cancelled()
@@ -5,9 +5,10 @@ import threading
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 import ipaddress
-from transfer import ZynqCommunicator
+from session import ZynqSession
 from scope import PlotWidget
 from generator import SignalGeneratorWidget
+from channels import parse_frame
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import pyqtSignal, QObject
 import sys
@@ -18,8 +19,10 @@ logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 class MainApp(QObject):
-    update_waveform_signal = pyqtSignal(list, int)  # 更新为传递波形数据和采样率
+    update_waveform_signal = pyqtSignal(object, int)  # 传递 (采样点数, 通道数) 的波形数组和采样率
     update_device_signal = pyqtSignal(list)  # 定义一个信号，传递设备列表
+    update_command_stats_signal = pyqtSignal(dict)  # 传递命令通道统计（在途数、往返时间）
+    update_link_signal = pyqtSignal(str, float)  # 传递连接状态和恢复耗时
 
     def __init__(self, root):
         super().__init__()
@@ -34,6 +37,8 @@ class MainApp(QObject):
         self.plot_window = PlotWidget(self)
         self.update_waveform_signal.connect(self.plot_window.update_plot)
         self.update_device_signal.connect(self.update_device_buttons)
+        self.update_command_stats_signal.connect(self.plot_window.update_command_stats)
+        self.update_link_signal.connect(self.plot_window.update_link_status)
 
         self.init_main_ui()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -105,7 +110,10 @@ class MainApp(QObject):
 
     def connect_to_device(self, ip):
         self.selected_device = ip
-        self.communicator = ZynqCommunicator(ip, 6401)
+        self.communicator = ZynqSession(ip, 6401)
+        # 会话层在接收/心跳线程中发出状态，转回主线程后再更新界面
+        self.communicator.link_state_signal.connect(
+            lambda state, recovery_time: self.root.after(0, lambda: self.update_link_signal.emit(state, recovery_time)))
         self.connect_thread = threading.Thread(target=self.connect_and_update_ui)
         self.connect_thread.start()
 
@@ -132,34 +140,49 @@ class MainApp(QObject):
             self.communicator.send_data({"cmd_type": "switch", "instrument": "generator"})
             self.signal_generator_widget = SignalGeneratorWidget(self.communicator)
             self.signal_generator_widget.show()
+            self.listen_for_data()  # 发生器模式同样需要读取命令应答
 
     def listen_for_data(self):
         self.stop_event.clear()
+        if hasattr(self, 'receive_thread') and self.receive_thread.is_alive():
+            return  # 同一连接只保留一个接收线程，避免多个线程争抢数据包
         self.receive_thread = threading.Thread(target=self.receive_data_loop)
         self.receive_thread.start()
 
     def receive_data_loop(self):
-        while self.communicator.is_connected and not self.stop_event.is_set():
+        # 断线时 receive_data 会在会话层内重连并返回None，循环继续即可恢复绘制
+        while self.communicator.is_alive and not self.stop_event.is_set():
             try:
                 data = self.communicator.receive_data()
-                if data:
+                if data and data.get("cmd_type") == "ack":
+                    stats = self.communicator.command_stats()
+                    self.root.after(0, lambda stats=stats: self.update_command_stats_signal.emit(stats))
+                elif data:
                     raw_waveform = data.get("waveform")
                     sample_rate = data.get("sample_rate", 64000000)
+                    n_channels = data.get("channels", 1)  # 多通道时采样点按通道交织
                     if raw_waveform:
-                        waveform = self.parse_adc_data(raw_waveform)
-                        self.root.after(0, lambda: self.update_waveform_signal.emit(waveform, sample_rate))
+                        try:
+                            waveform = self.parse_adc_data(raw_waveform, n_channels)
+                        except ValueError as e:
+                            log.warning(f"丢弃无效数据帧: {e}")  # 只丢弃这一帧，接收循环继续
+                            continue
+                        # 创建回调时绑定本帧数据，避免 Tk 尚未执行回调时被下一帧覆盖（录制/导出依赖每帧都送达）
+                        self.root.after(0, lambda w=waveform, r=sample_rate: self.update_waveform_signal.emit(w, r))
             except Exception as e:
                 log.error(f"接收数据时出错: {e}")
                 break
 
-    def parse_adc_data(self, raw_waveform):
-        return [(value / 2048) * 5.0 for value in raw_waveform]
+    def parse_adc_data(self, raw_waveform, n_channels=1):
+        return parse_frame(raw_waveform, n_channels)
 
     def on_closing(self):
         if messagebox.askokcancel("退出", "确定要退出吗？"):
             self.stop_event.set()
-            if hasattr(self, 'communicator') and self.communicator.is_connected:
-                self.communicator.send_data({"cmd_type": "exitins"})
+            self.plot_window.shutdown()  # 取消导出并删除录制临时文件
+            if hasattr(self, 'communicator'):
+                if self.communicator.is_connected:
+                    self.communicator.send_data({"cmd_type": "exitins"})
                 self.communicator.disconnect()
             self.root.destroy()
             QApplication.instance().quit()
@@ -0,0 +1,126 @@
+import ast
+import re
+import numpy as np
+
+BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+FUNCTIONS = ("abs", "integ", "deriv")
+CHANNEL_PATTERN = re.compile(r"^(?:CH([1-9][0-9]*)|([A-Z]))$")  # CH1 或 A 均表示第一通道
+
+
+def channel_index(name):
+    """将通道名（CH1/A）转换为从0开始的通道序号，不是通道名时返回None"""
+    match = CHANNEL_PATTERN.match(name.upper())
+    if not match:
+        return None
+    return int(match.group(1)) - 1 if match.group(1) else ord(match.group(2)) - ord("A")
+
+
+class MathExpression:
+    '''
+    数学通道表达式
+    表达式只在构造时解析一次，编译为按顺序执行的 NumPy 运算步骤；
+    每帧计算时所有中间结果都写入预分配的缓冲区，不产生新的数组
+    支持：通道 A/B/...或 CH1/CH2/...、数字常量、+ - * /、取负，以及 abs()、integ()（积分）、deriv()（微分）
+    '''
+    def __init__(self, text):
+        self.text = text.strip()
+        self.steps = []  # (运算名, 操作数列表, 输出缓冲区序号)
+        self.max_channel = -1
+        try:
+            tree = ast.parse(self.text, mode="eval")
+        except SyntaxError:
+            raise ValueError(f"表达式语法错误: {self.text}")
+        self.result = self.compile_node(tree.body)
+        self.buffers = np.empty((0, 0), dtype=np.float32)
+
+    def compile_node(self, node):
+        """编译语法树节点，返回操作数：('ch', 通道序号)、('const', 数值) 或 ('buf', 缓冲区序号)"""
+        if isinstance(node, ast.Name):
+            ch = channel_index(node.id)
+            if ch is None:
+                raise ValueError(f"未知通道: {node.id}")
+            self.max_channel = max(self.max_channel, ch)
+            return ("ch", ch)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return ("const", float(node.value))
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            operands = [self.compile_node(node.left), self.compile_node(node.right)]
+            return self.add_step(type(node.op), operands)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.compile_node(node.operand)
+            return operand if isinstance(node.op, ast.UAdd) else self.add_step(ast.USub, [operand])
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            if len(node.args) != 1 or node.keywords:
+                raise ValueError(f"{node.func.id}() 只接受一个参数")
+            return self.add_step(node.func.id, [self.compile_node(node.args[0])])
+        raise ValueError(f"不支持的表达式: {ast.unparse(node)}")
+
+    def add_step(self, op, operands):
+        out = len(self.steps)
+        self.steps.append((op, operands, out))
+        return ("buf", out)
+
+    def operand(self, operand, frame):
+        kind, value = operand
+        if kind == "ch":
+            return frame[:, value]
+        if kind == "buf":
+            return self.buffers[value]
+        return value
+
+    def evaluate(self, frame, dt, out):
+        """对一帧 (采样点数, 通道数) 数据求值，结果写入 out"""
+        n_samples, n_channels = frame.shape
+        if self.max_channel >= n_channels:
+            raise ValueError(f"表达式引用了不存在的通道: {self.text}")
+        if self.buffers.shape != (len(self.steps), n_samples):
+            self.buffers = np.empty((len(self.steps), n_samples), dtype=np.float32)
+
+        for op, operands, index in self.steps:
+            args = [self.operand(operand, frame) for operand in operands]
+            buf = self.buffers[index]
+            if op in BINARY_OPS:
+                BINARY_OPS[op](args[0], args[1], out=buf)
+            elif op is ast.USub:
+                np.negative(args[0], out=buf)
+            elif op == "abs":
+                np.abs(args[0], out=buf)
+            elif op == "integ":
+                np.cumsum(np.broadcast_to(args[0], buf.shape), out=buf)
+                buf *= dt
+            elif op == "deriv":
+                if n_samples < 2:
+                    buf.fill(0)
+                    continue
+                x = np.broadcast_to(args[0], buf.shape)
+                np.subtract(x[1:], x[:-1], out=buf[1:])
+                buf[0] = buf[1]
+                buf /= dt
+        out[...] = self.operand(self.result, frame)
+
+
+class MathChannelSet:
+    '''
+    一组数学通道
+    用分号分隔多个表达式，如 "A-B; A*B; integ(A)"，结果写入共享的 (采样点数, 数学通道数) 输出缓冲区
+    '''
+    def __init__(self, text):
+        self.expressions = [MathExpression(part) for part in text.split(";") if part.strip()]
+        self.output = np.empty((len(self.expressions), 0), dtype=np.float32)  # 每个数学通道占一行，保证写入连续
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def evaluate(self, frame, sample_rate=None):
+        """计算所有数学通道，返回 (采样点数, 数学通道数) 的输出缓冲区视图（下一帧会被覆盖）"""
+        if self.output.shape[1] != frame.shape[0]:
+            self.output = np.empty((len(self.expressions), frame.shape[0]), dtype=np.float32)
+        dt = 1.0 / sample_rate if sample_rate else 1.0
+        for ch, expression in enumerate(self.expressions):
+            expression.evaluate(frame, dt, self.output[ch])
+        return self.output.T
@@ -1,11 +1,20 @@
-from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QLabel, QWidget
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QHBoxLayout, QLabel, QWidget, QCheckBox, QDoubleSpinBox, QComboBox, QLineEdit, QPushButton, QSpinBox, QProgressBar, QFileDialog
+from PyQt5.QtCore import Qt
+from collections import deque
 import pyqtgraph as pg
 import numpy as np
 import time
 import logging
+from channels import find_trigger, decimation_step
+from math_channels import MathChannelSet
+from export import FrameSource, CaptureRecorder, ExportWorker, RecordingError, EXPORT_FORMATS
 
 log = logging.getLogger(__name__)
 
+CHANNEL_COLORS = ['y', 'c', 'm', 'g', 'r', 'b', 'w']
+MAX_PLOT_POINTS = 4000  # 每条曲线最多绘制的点数，超出时所有通道按同一步长抽取
+MAX_HISTORY_FRAMES = 100  # 为“最近N帧”导出保留的帧数
+
 class PlotWidget(QMainWindow):
     '''
     示波器界面
@@ -22,16 +31,103 @@ class PlotWidget(QMainWindow):
         self.plot_widget.setLabel('left', '幅值')
         self.plot_widget.setLabel('bottom', '时间')
         self.plot_widget.showGrid(x=True, y=True)
-        self.curve = self.plot_widget.plot([], pen='y')
+
+        # 各通道的曲线、开关和垂直缩放，收到第一帧后按通道数创建
+        self.curves = []
+        self.channel_checks = []
+        self.channel_scale_spins = []
+        self.channel_enabled = np.ones(0, dtype=bool)
+        self.channel_scales = np.ones(0, dtype=np.float32)
+        self.channel_layout = QHBoxLayout()
+
+        # 触发设置，所有通道共用同一触发位置
+        self.trigger_combo = QComboBox()
+        self.trigger_combo.addItem("自由运行")
+        self.trigger_level_spin = QDoubleSpinBox()
+        self.trigger_level_spin.setRange(-5.0, 5.0)
+        self.trigger_level_spin.setSingleStep(0.1)
+        self.trigger_level_spin.setSuffix(" V")
+        trigger_layout = QHBoxLayout()
+        trigger_layout.addWidget(QLabel("触发源:"))
+        trigger_layout.addWidget(self.trigger_combo)
+        trigger_layout.addWidget(QLabel("触发电平:"))
+        trigger_layout.addWidget(self.trigger_level_spin)
+        trigger_layout.addStretch()
+
+        # 数学通道：表达式只在点击应用时解析一次，之后每帧按预编译的计划求值
+        self.math_set = None
+        self.math_curves = []
+        self.math_input = QLineEdit()
+        self.math_input.setPlaceholderText("数学通道，多个用分号分隔，如 A-B; A*B; integ(A); deriv(B)")
+        self.math_apply_button = QPushButton("应用")
+        self.math_apply_button.clicked.connect(self.apply_math_channels)
+        self.math_error_label = QLabel("")
+        math_layout = QHBoxLayout()
+        math_layout.addWidget(QLabel("数学:"))
+        math_layout.addWidget(self.math_input)
+        math_layout.addWidget(self.math_apply_button)
+        math_layout.addWidget(self.math_error_label)
+
+        # X-Y 模式：以一个通道为横轴、另一个通道为纵轴绘制
+        self.xy_check = QCheckBox("X-Y 模式")
+        self.xy_check.toggled.connect(self.set_xy_mode)
+        self.xy_x_combo = QComboBox()
+        self.xy_y_combo = QComboBox()
+        self.xy_curve = self.plot_widget.plot([], pen='w')
+        xy_layout = QHBoxLayout()
+        xy_layout.addWidget(self.xy_check)
+        xy_layout.addWidget(QLabel("X:"))
+        xy_layout.addWidget(self.xy_x_combo)
+        xy_layout.addWidget(QLabel("Y:"))
+        xy_layout.addWidget(self.xy_y_combo)
+        xy_layout.addStretch()
+
+        # 导出：当前帧、最近N帧或录制数据，写文件在后台线程中分块进行
+        self.frame_history = deque(maxlen=MAX_HISTORY_FRAMES)  # (帧, 采样率)
+        self.recorder = None
+        self.capture = None
+        self.capture_pending_removal = None  # 正在被导出的录制文件，导出结束后再删除
+        self.export_worker = None
+        self.export_source_combo = QComboBox()
+        self.export_source_combo.addItems(["当前帧", "最近N帧", "录制数据"])
+        self.export_frames_spin = QSpinBox()
+        self.export_frames_spin.setRange(1, MAX_HISTORY_FRAMES)
+        self.export_frames_spin.setValue(10)
+        self.export_format_combo = QComboBox()
+        self.export_format_combo.addItems([fmt.upper() for fmt in EXPORT_FORMATS])
+        self.record_button = QPushButton("开始录制")
+        self.record_button.clicked.connect(self.toggle_recording)
+        self.export_button = QPushButton("导出")
+        self.export_button.clicked.connect(self.start_export)
+        self.export_progress = QProgressBar()
+        self.export_progress.setRange(0, 100)
+        export_layout = QHBoxLayout()
+        export_layout.addWidget(self.record_button)
+        export_layout.addWidget(QLabel("导出:"))
+        export_layout.addWidget(self.export_source_combo)
+        export_layout.addWidget(QLabel("N:"))
+        export_layout.addWidget(self.export_frames_spin)
+        export_layout.addWidget(self.export_format_combo)
+        export_layout.addWidget(self.export_button)
+        export_layout.addWidget(self.export_progress)
 
         # 参数显示区域，使用QLabel代替
         self.peak_voltage_label = QLabel("峰值电压: 未知")
         self.sample_rate_label = QLabel("采样率: 未知")
+        self.link_label = QLabel("连接: 未知")
+        self.command_stats_label = QLabel("命令往返: 未知")
 
         # 设置布局
         layout = QVBoxLayout()
         layout.addWidget(self.peak_voltage_label)
         layout.addWidget(self.sample_rate_label)
+        layout.addWidget(self.link_label)
+        layout.addWidget(self.command_stats_label)
+        layout.addLayout(self.channel_layout)
+        layout.addLayout(trigger_layout)
+        layout.addLayout(math_layout)
+        layout.addLayout(xy_layout)
+        layout.addLayout(export_layout)
         layout.addWidget(self.plot_widget)
 
         container = QWidget()
@@ -41,15 +137,136 @@ class PlotWidget(QMainWindow):
         # 帧率计算变量
         self.last_update_time = time.time()
 
+    def setup_channels(self, n_channels):
+        """按通道数重建曲线和通道控件"""
+        for curve in self.curves:
+            self.plot_widget.removeItem(curve)
+        for widget in self.channel_checks + self.channel_scale_spins:
+            self.channel_layout.removeWidget(widget)
+            widget.deleteLater()
+
+        self.curves = []
+        self.channel_checks = []
+        self.channel_scale_spins = []
+        self.channel_enabled = np.ones(n_channels, dtype=bool)
+        self.channel_scales = np.ones(n_channels, dtype=np.float32)
+        while self.trigger_combo.count() > 1:
+            self.trigger_combo.removeItem(1)
+
+        for ch in range(n_channels):
+            color = CHANNEL_COLORS[ch % len(CHANNEL_COLORS)]
+            self.curves.append(self.plot_widget.plot([], pen=color))
+
+            check = QCheckBox(f"CH{ch + 1}")
+            check.setChecked(True)
+            check.toggled.connect(lambda checked, ch=ch: self.set_channel_enabled(ch, checked))
+            scale_spin = QDoubleSpinBox()
+            scale_spin.setRange(0.01, 100.0)
+            scale_spin.setValue(1.0)
+            scale_spin.setPrefix("×")
+            scale_spin.valueChanged.connect(lambda value, ch=ch: self.set_channel_scale(ch, value))
+            self.channel_layout.addWidget(check)
+            self.channel_layout.addWidget(scale_spin)
+            self.channel_checks.append(check)
+            self.channel_scale_spins.append(scale_spin)
+            self.trigger_combo.addItem(f"CH{ch + 1}")
+        self.update_xy_sources()
+
+    def apply_math_channels(self):
+        """解析数学通道表达式并重建数学曲线"""
+        try:
+            math_set = MathChannelSet(self.math_input.text())
+        except ValueError as e:
+            self.math_error_label.setText(str(e))
+            return
+        self.math_error_label.setText("")
+        self.set_math_channels(math_set if len(math_set) else None)
+
+    def set_math_channels(self, math_set):
+        for curve in self.math_curves:
+            self.plot_widget.removeItem(curve)
+        self.math_set = math_set
+        n_math = len(math_set) if math_set else 0
+        self.math_curves = [
+            self.plot_widget.plot([], pen=pg.mkPen(CHANNEL_COLORS[-1 - m % len(CHANNEL_COLORS)], style=Qt.DashLine))
+            for m in range(n_math)
+        ]
+        self.update_xy_sources()
+
+    def update_xy_sources(self):
+        """X-Y 模式的可选数据源：所有实际通道和数学通道"""
+        n_math = len(self.math_set) if self.math_set else 0
+        sources = [f"CH{ch + 1}" for ch in range(len(self.curves))] + [f"M{m + 1}" for m in range(n_math)]
+        for combo, default in ((self.xy_x_combo, 0), (self.xy_y_combo, 1)):
+            current = combo.currentIndex()
+            combo.clear()
+            combo.addItems(sources)
+            combo.setCurrentIndex(current if 0 <= current < len(sources) else min(default, len(sources) - 1))
+
+    def set_xy_mode(self, enabled):
+        for curve in self.curves + self.math_curves + [self.xy_curve]:
+            curve.clear()
+        self.plot_widget.setLabel('left', 'Y' if enabled else '幅值')
+        self.plot_widget.setLabel('bottom', 'X' if enabled else '时间')
+
+    def set_channel_enabled(self, ch, enabled):
+        self.channel_enabled[ch] = enabled
+        if not enabled:
+            self.curves[ch].clear()
+
+    def set_channel_scale(self, ch, value):
+        self.channel_scales[ch] = value
+
     def update_plot(self, waveform, sample_rate=None):
-        """更新波形绘制和参数显示"""
+        """
+        更新波形绘制和参数显示
+        waveform 为 (采样点数, 通道数) 的数组，触发、抽取、缩放和测量都对所有通道整体做一次
+        """
         if waveform is not None:
-            time_axis = np.arange(len(waveform))
-            self.curve.setData(time_axis, waveform)
+            frame = np.asarray(waveform)
+            if frame.ndim == 1:
+                frame = frame.reshape(-1, 1)
+            n_samples, n_channels = frame.shape
+            if n_channels != len(self.curves):
+                self.setup_channels(n_channels)
+
+            # 保留原始帧供导出，录制只是入队，写盘由录制线程完成
+            self.frame_history.append((frame, sample_rate))
+            if self.recorder is not None:
+                if self.recorder.error is not None:
+                    self.stop_recording()  # 写入失败时立即停止录制并提示
+                else:
+                    self.recorder.append(frame, sample_rate)
 
-            # 计算并显示峰值电压
-            peak_voltage = max(waveform) - min(waveform)
-            self.peak_voltage_label.setText(f"峰值电压: {peak_voltage:.2f} V")
+            # 共用的触发位置和抽取步长，切片只产生视图
+            trigger_source = self.trigger_combo.currentIndex() - 1
+            start = find_trigger(frame[:, trigger_source], self.trigger_level_spin.value()) if trigger_source >= 0 else 0
+            step = decimation_step(n_samples - start, MAX_PLOT_POINTS)
+            time_axis = np.arange(0, n_samples - start, step)  # 以触发点为零点，触发位置在屏幕上保持不动
+            scaled = frame[start::step] * self.channel_scales
+
+            # 数学通道在完整帧上求值（积分需要从帧首累计），之后与实际通道走同样的触发和抽取
+            math_frame = self.evaluate_math_channels(frame, sample_rate)
+            math_view = math_frame[start::step] if math_frame is not None else np.empty((len(time_axis), 0))
+
+            if self.xy_check.isChecked():
+                x_source = self.xy_x_combo.currentIndex()
+                y_source = self.xy_y_combo.currentIndex()
+                if x_source >= 0 and y_source >= 0:
+                    self.xy_curve.setData(self.source_column(x_source, scaled, math_view),
+                                          self.source_column(y_source, scaled, math_view))
+            else:
+                for ch in np.flatnonzero(self.channel_enabled):
+                    self.curves[ch].setData(time_axis, scaled[:, ch])
+                for m, curve in enumerate(self.math_curves):
+                    curve.setData(time_axis, math_view[:, m])
+
+            # 计算并显示各通道峰峰值电压
+            peak_voltage = np.ptp(frame, axis=0) if n_samples else np.zeros(n_channels)
+            peak_text = [f"CH{ch + 1} {value:.2f} V" for ch, value in enumerate(peak_voltage)]
+            if math_frame is not None and n_samples:
+                peak_text += [f"M{m + 1} {value:.2f}" for m, value in enumerate(np.ptp(math_frame, axis=0))]
+            self.peak_voltage_label.setText("峰值电压: " + "  ".join(peak_text))
 
             # 更新采样率显示
             if sample_rate:
@@ -62,8 +279,148 @@ class PlotWidget(QMainWindow):
             frame_rate = 1.0 / frame_time
             log.info(f"当前绘制帧率: {frame_rate:.2f} FPS")
 
+    def evaluate_math_channels(self, frame, sample_rate):
+        """计算数学通道，表达式与当前帧不匹配时关闭数学通道并提示"""
+        if self.math_set is None:
+            return None
+        try:
+            return self.math_set.evaluate(frame, sample_rate)
+        except ValueError as e:
+            self.math_error_label.setText(str(e))
+            self.set_math_channels(None)
+            return None
+
+    @staticmethod
+    def source_column(index, channels, math_channels):
+        """按 X-Y 数据源序号取列：先实际通道，后数学通道"""
+        n_channels = channels.shape[1]
+        return channels[:, index] if index < n_channels else math_channels[:, index - n_channels]
+
+    def update_command_stats(self, stats):
+        """显示命令通道在途数和往返时间"""
+        if not stats.get("count"):
+            self.command_stats_label.setText(f"命令往返: 无数据（在途 {stats.get('inflight', 0)}）")
+            return
+        self.command_stats_label.setText(
+            f"命令往返: 平均 {stats['rtt_avg_ms']:.2f} ms  P95 {stats['rtt_p95_ms']:.2f} ms  "
+            f"最大 {stats['rtt_max_ms']:.2f} ms（在途 {stats['inflight']}）")
+
+    def update_link_status(self, state, recovery_time):
+        """显示连接状态和最近一次断线恢复耗时"""
+        if state == "reconnecting":
+            self.link_label.setText("连接: 已断开，正在重连...")
+        elif state == "recovered":
+            self.link_label.setText(f"连接: 已恢复（恢复耗时 {recovery_time * 1000:.0f} ms）")
+        else:
+            self.link_label.setText("连接: 正常")
+
+    def toggle_recording(self):
+        """开始/停止录制，录制数据写入临时文件，不占用内存"""
+        if self.recorder is None:
+            self.discard_capture()
+            self.recorder = CaptureRecorder()
+            self.record_button.setText("停止录制")
+        else:
+            self.stop_recording()
+
+    def stop_recording(self):
+        """停止录制；写入失败时不保留录制结果，并在导出状态栏中提示"""
+        recorder, self.recorder = self.recorder, None
+        self.record_button.setText("开始录制")
+        try:
+            self.capture = recorder.stop()
+        except RecordingError as e:
+            self.capture = None
+            self.export_progress.setFormat(str(e))
+            return
+        log.info(f"录制完成: {self.capture.n_samples} 个采样点")
+
+    def discard_capture(self):
+        """停止录制并删除录制文件；若该文件正在导出，则等导出结束后再删除"""
+        if self.recorder is not None:
+            self.stop_recording()
+        if self.capture is None:
+            return
+        if self.export_worker is not None and self.export_worker.source is self.capture:
+            self.capture_pending_removal = self.capture
+        else:
+            self.capture.remove()
+        self.capture = None
+
+    def shutdown(self):
+        """程序退出时调用：取消正在进行的导出并清理录制文件"""
+        worker = self.export_worker
+        if worker is not None:
+            if worker.source is self.capture or worker.source is self.capture_pending_removal:
+                # 写线程退出、释放文件映射后由其自行删除录制文件，即使下面的等待超时也不会漏删
+                worker.on_cancelled = worker.source.remove
+            worker.cancel()
+            if not worker.thread.is_alive():
+                self.export_worker = None
+        # 导出线程仍在运行时，discard_capture 会把录制文件转入 capture_pending_removal，不在此处删除
+        self.discard_capture()
+        if self.capture_pending_removal is not None and self.export_worker is None:
+            self.capture_pending_removal.remove()
+            self.capture_pending_removal = None
+
+    def export_source(self):
+        """按当前选择构造导出数据源"""
+        choice = self.export_source_combo.currentIndex()
+        if choice == 2:
+            return self.capture
+        if not self.frame_history:
+            return None
+        count = 1 if choice == 0 else self.export_frames_spin.value()
+        history = list(self.frame_history)[-count:]
+        last_frame, sample_rate = history[-1]
+        # 只导出与最新一帧通道数和采样率一致的帧
+        frames = [frame for frame, rate in history if frame.shape[1] == last_frame.shape[1] and rate == sample_rate]
+        return FrameSource(frames, sample_rate)
+
+    def start_export(self):
+        if self.export_worker is not None:
+            return
+        source = self.export_source()
+        if source is None or not source.n_samples:
+            self.export_progress.setFormat("没有可导出的数据")
+            return
+        fmt = EXPORT_FORMATS[self.export_format_combo.currentIndex()]
+        path, _ = QFileDialog.getSaveFileName(self, "导出波形", f"capture.{fmt}", f"{fmt.upper()} (*.{fmt})")
+        if not path:
+            return
+
+        # 导出线程的信号与其他后台线程一样经 Tk 主循环转回主线程
+        dispatch = (lambda fn: self.main_app.root.after(0, fn)) if self.main_app else None
+        self.export_worker = ExportWorker(source, path, fmt, dispatch)
+        self.export_worker.progress_signal.connect(self.export_progress.setValue)
+        self.export_worker.finished_signal.connect(self.on_export_finished)
+        self.export_worker.error_signal.connect(self.on_export_error)
+        self.export_button.setEnabled(False)
+        if source is self.capture:
+            self.record_button.setEnabled(False)  # 重新录制会删除正在导出的文件
+        self.export_progress.setFormat("%p%")
+        self.export_progress.setValue(0)
+        self.export_worker.start()
+
+    def on_export_finished(self, path):
+        self.end_export()
+        self.export_progress.setFormat(f"已导出: {path}")
+
+    def on_export_error(self, message):
+        self.end_export()
+        self.export_progress.setFormat(f"导出失败: {message}")
+
+    def end_export(self):
+        self.export_worker = None
+        self.export_button.setEnabled(True)
+        self.record_button.setEnabled(True)
+        if self.capture_pending_removal is not None:
+            self.capture_pending_removal.remove()
+            self.capture_pending_removal = None
+
     def closeEvent(self, event):
         """重载窗口关闭事件以发送退出指令"""
+        self.discard_capture()
         if self.main_app and self.main_app.communicator.is_connected:
             self.main_app.communicator.send_data({"cmd_type": "exitins"})
             print("已发送")
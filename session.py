@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import deque
+from PyQt5.QtCore import pyqtSignal, QObject
+from transfer import ZynqCommunicator
+
+log = logging.getLogger(__name__)
+
+REPLAY_ORDER = ("switch", "update")  # 重连后按此顺序重放的状态命令
+
+
+class ZynqSession(QObject):
+    '''
+    会话层
+    包装 ZynqCommunicator，通过心跳和读超时检测断线，
+    按指数退避自动重连并重放最近的 switch/update 状态，上层接收循环无需重启
+    '''
+    link_state_signal = pyqtSignal(str, float)  # 连接状态："connected"/"reconnecting"/"recovered"，恢复耗时（秒）
+
+    def __init__(self, ip, port, heartbeat_interval=1.0, read_timeout=3.0,
+                 backoff_initial=0.2, backoff_max=5.0, recv_buffer_size=4 * 1024 * 1024):
+        super().__init__()
+        # 读超时需大于心跳间隔：设备空闲时至少会回复心跳应答
+        self.communicator = ZynqCommunicator(ip, port, recv_buffer_size=recv_buffer_size, read_timeout=read_timeout)
+        self.heartbeat_interval = heartbeat_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self.last_state = {}  # cmd_type -> 最近一次的状态命令
+        self.generation = 0  # 每次重连成功加一，避免多个线程对同一次断线重复重连
+        self.recover_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.recovery_times = deque(maxlen=20)  # 最近的断线恢复耗时（秒）
+        self.heartbeat_thread = None
+
+    @property
+    def is_connected(self):
+        return self.communicator.is_connected
+
+    @property
+    def is_alive(self):
+        """会话未被主动关闭（断线重连期间仍为 True）"""
+        return not self.closed.is_set()
+
+    def command_stats(self):
+        """命令通道统计，见 ZynqCommunicator.command_stats"""
+        return self.communicator.command_stats()
+
+    def connect(self):
+        """建立连接并启动心跳线程"""
+        self.closed.clear()
+        self.communicator.connect()
+        if self.communicator.is_connected:
+            self.link_state_signal.emit("connected", 0.0)
+            if self.heartbeat_thread is None or not self.heartbeat_thread.is_alive():
+                self.heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
+                self.heartbeat_thread.start()
+
+    def disconnect(self):
+        """主动关闭会话，不再重连"""
+        self.closed.set()
+        self.communicator.disconnect()
+
+    def send_data(self, data):
+        """发送命令并记录状态命令，用于重连后重放"""
+        cmd_type = data.get("cmd_type")
+        if cmd_type in REPLAY_ORDER:
+            self.last_state[cmd_type] = data
+        elif cmd_type == "exitins":
+            self.last_state.clear()
+        return self.communicator.send_data(data)
+
+    def receive_data(self):
+        """接收一个数据包；链路异常时就地重连并返回None，调用方继续循环即可"""
+        if self.closed.is_set():
+            return None
+        generation = self.generation
+        data = self.communicator.receive_data() if self.communicator.is_connected else None
+        if data is None:
+            self.recover(generation)
+        return data
+
+    def heartbeat_loop(self):
+        """定期发送心跳，使空闲链路上也有应答流量可供读超时检测"""
+        while not self.closed.wait(self.heartbeat_interval):
+            generation = self.generation
+            if self.communicator.is_connected and self.communicator.send_data({"cmd_type": "heartbeat"}) is None:
+                self.recover(generation)
+
+    def recover(self, generation):
+        """断线重连：指数退避直至成功，然后重放状态命令"""
+        with self.recover_lock:
+            if self.closed.is_set() or generation != self.generation:
+                return  # 会话已关闭，或其他线程已完成这次重连
+
+            start_time = time.perf_counter()
+            log.warning("与Zynq设备的连接中断，正在重连")
+            self.link_state_signal.emit("reconnecting", 0.0)
+            self.communicator.disconnect()
+
+            delay = self.backoff_initial
+            while not self.closed.is_set():
+                self.communicator.connect()
+                if self.communicator.is_connected:
+                    break
+                self.closed.wait(delay)
+                delay = min(delay * 2, self.backoff_max)
+            if self.closed.is_set():
+                return
+
+            for cmd_type in REPLAY_ORDER:
+                if cmd_type in self.last_state:
+                    self.communicator.send_data(self.last_state[cmd_type])
+
+            self.generation += 1
+            recovery_time = time.perf_counter() - start_time
+            self.recovery_times.append(recovery_time)
+            log.info(f"已恢复与Zynq设备的连接，恢复耗时: {recovery_time:.3f} s")
+            self.link_state_signal.emit("recovered", recovery_time)
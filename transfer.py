@@ -1,6 +1,9 @@
 import socket
 import json
 import logging
+import threading
+import time
+from collections import deque
 from PyQt5.QtCore import pyqtSignal, QObject
 import struct  # 用于处理包头的二进制数据
 
@@ -8,20 +11,40 @@ import struct  # 用于处理包头的二进制数据
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+HEADER_FORMAT = "!I"  # 包头：4字节，网络字节序的无符号整型，表示数据长度
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
 class ZynqCommunicator(QObject):
     data_received_signal = pyqtSignal(dict)  # 定义一个信号用于接收数据
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, pending_timeout=5.0, recv_buffer_size=None, read_timeout=None):
         super().__init__()  # 调用 QObject 的初始化
         self.ip = ip
         self.port = port
         self.socket = None
         self.is_connected = False
+        self.recv_buffer_size = recv_buffer_size  # 套接字接收缓冲区大小（字节），None 使用系统默认
+        self.read_timeout = read_timeout  # 读超时（秒），None 表示一直阻塞
+
+        # 命令通道状态：允许多条命令同时在途，按请求ID匹配应答
+        self.pending_timeout = pending_timeout  # 超过该时间仍未应答的命令视为丢失
+        self.next_req_id = 1
+        self.pending = {}  # req_id -> (发送时刻, cmd_type)
+        self.rtt_samples = deque(maxlen=100)  # 最近的命令往返时间（秒）
+        self.send_lock = threading.Lock()  # 保证每个数据包被完整写入，不与其他线程交错
+        self.pending_lock = threading.Lock()
 
     def connect(self):
         """连接到Zynq设备"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # 控制命令都很短，关闭 Nagle 算法避免命令被攒包延迟发送
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.recv_buffer_size:
+                # 需在 connect 之前设置，才能协商到足够大的 TCP 窗口
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+            self.socket.settimeout(self.read_timeout)
             self.socket.connect((self.ip, self.port))
             self.is_connected = True
             log.info(f"已连接到Zynq设备: {self.ip}:{self.port}")
@@ -34,45 +57,121 @@ class ZynqCommunicator(QObject):
         if self.socket:
             self.socket.close()
             self.is_connected = False
+            self.fail_pending()
             log.info("已断开与Zynq设备的连接")
 
     def send_data(self, data):
-        """发送数据到Zynq设备"""
+        """
+        发送命令到Zynq设备
+        命令带4字节长度包头和请求ID，不等待应答直接返回，
+        应答由 receive_data 异步匹配；返回请求ID，发送失败返回None
+        """
         if not self.is_connected:
             log.error("未连接到Zynq设备")
-            return
-        
+            return None
+
+        req_id = None
         try:
-            json_data = json.dumps(data)
-            self.socket.sendall(json_data.encode('utf-8'))
-            log.info(f"发送数据: {json_data}")
+            with self.pending_lock:
+                now = time.perf_counter()
+                self.prune_pending(now)  # 无人读取应答时（如示波器窗口已关闭）也不会无限累积
+                req_id = self.next_req_id
+                self.next_req_id += 1
+                self.pending[req_id] = (now, data.get("cmd_type"))
+
+            json_data = json.dumps(dict(data, req_id=req_id))
+            payload = json_data.encode('utf-8')
+            with self.send_lock:
+                self.socket.sendall(struct.pack(HEADER_FORMAT, len(payload)) + payload)
+            log.log(self.command_log_level(data), f"发送数据: {json_data}")
+            return req_id
         except Exception as e:
             log.error(f"发送数据失败: {e}")
+            with self.pending_lock:
+                self.pending.pop(req_id, None)
+            return None
+
+    def prune_pending(self, now):
+        """清理超时未应答的命令，调用方需持有 pending_lock"""
+        for stale_id in [i for i, (sent, _) in self.pending.items() if now - sent > self.pending_timeout]:
+            _, cmd_type = self.pending.pop(stale_id)
+            log.warning(f"命令应答超时: req_id={stale_id}, cmd_type={cmd_type}")
+
+    def handle_ack(self, ack):
+        """匹配命令应答，记录往返时间"""
+        req_id = ack.get("req_id")
+        now = time.perf_counter()
+        with self.pending_lock:
+            entry = self.pending.pop(req_id, None)
+            self.prune_pending(now)
+            if entry is None:
+                log.warning(f"收到未知命令的应答: {ack}")
+                return
+            sent, cmd_type = entry
+            rtt = now - sent
+            self.rtt_samples.append(rtt)
+
+        log.log(self.command_log_level({"cmd_type": cmd_type}), f"命令应答: req_id={req_id}, cmd_type={cmd_type}, 状态={ack.get('status', 'ok')}, 往返时间={rtt * 1000:.2f} ms")
+
+    @staticmethod
+    def command_log_level(data):
+        """心跳命令较频繁，只在调试级别输出"""
+        return logging.DEBUG if data.get("cmd_type") == "heartbeat" else logging.INFO
+
+    def fail_pending(self):
+        """连接断开时放弃所有在途命令"""
+        with self.pending_lock:
+            self.pending.clear()
+
+    def command_stats(self):
+        """命令通道统计：在途命令数和往返时间（毫秒）"""
+        with self.pending_lock:
+            samples = sorted(self.rtt_samples)
+            inflight = len(self.pending)
+        if not samples:
+            return {"inflight": inflight, "count": 0}
+        return {
+            "inflight": inflight,
+            "count": len(samples),
+            "rtt_min_ms": samples[0] * 1000,
+            "rtt_avg_ms": sum(samples) / len(samples) * 1000,
+            "rtt_p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000,
+            "rtt_max_ms": samples[-1] * 1000,
+        }
+
+    def recv_exact(self, size):
+        """读取指定字节数，连接关闭时返回None"""
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = self.socket.recv_into(view[received:], size - received)
+            if not n:
+                return None
+            received += n
+        return buf
 
     def receive_data(self):
-        """接收来自Zynq设备的数据"""
+        """接收来自Zynq设备的数据，命令应答在此处理后同样返回"""
         if not self.is_connected:
             log.error("未连接到Zynq设备")
             return None
 
         try:
             # Step 1: 读取包头，获得数据长度（4字节，网络字节序）
-            header = self.socket.recv(4)
-            if len(header) < 4:
+            header = self.recv_exact(HEADER_SIZE)
+            if header is None:
                 log.error("接收包头失败")
                 return None
 
             # 将包头转换为整数，得到数据长度
-            data_len = struct.unpack("!I", header)[0]  # !I 表示网络字节序的无符号整型
+            data_len = struct.unpack(HEADER_FORMAT, header)[0]
 
             # Step 2: 根据长度读取数据内容
-            data = b""
-            while len(data) < data_len:
-                packet = self.socket.recv(data_len - len(data))
-                if not packet:
-                    log.error("接收数据包失败")
-                    return None
-                data += packet
+            data = self.recv_exact(data_len)
+            if data is None:
+                log.error("接收数据包失败")
+                return None
 
             # 将完整数据包转换为字符串
             response = data.decode('utf-8')
@@ -80,6 +179,9 @@ class ZynqCommunicator(QObject):
 
             # Step 3: 解析 JSON 数据
             data = json.loads(response)
+            if data.get("cmd_type") == "ack":
+                self.handle_ack(data)
+                return data
             self.data_received_signal.emit(data)  # 发射信号更新 GUI
             return data
         except Exception as e: